@@ -1,21 +1,107 @@
+import colorsys
 import folium
-import itertools
+from folium.utilities import get_bounds
+from jinja2 import Template
 import math
 import numpy as np
 import pandas as pd
-from typing import List
+import warnings
+from typing import List, Tuple
+
+# Limits on the resolution grid drawn by `display_map`.
+# Grid lines closer together than this many screen pixels are not drawn.
+MIN_GRID_SPACING_PX = 2
+# Grids with more lines than this along an axis are thinned.
+MAX_GRID_LINES = 500
+
+# Basemap tile sources used by `_build_basemap_feature_group`.
+_ESRI_URL = 'https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}'
+_ESRI_ATTR = ('Tiles &copy; Esri &mdash; Source: Esri, i-cubed, USDA, USGS, AEX, GeoEye, '
+              'Getmapping, Aerogrid, IGN, IGP, UPR-EGP, and the GIS User Community')
+_STAMEN_LABELS_URL = 'https://stamen-tiles-{s}.a.ssl.fastly.net/toner-labels/{z}/{x}/{y}{r}.png'
+_STAMEN_LINES_URL = 'https://stamen-tiles-{s}.a.ssl.fastly.net/toner-lines/{z}/{x}/{y}{r}.png'
+_STAMEN_ATTR = ('Map tiles by <a href="http://stamen.com">Stamen Design</a>, '
+                '<a href="http://creativecommons.org/licenses/by/3.0">CC BY 3.0</a> &mdash; '
+                'Map data &copy; <a href="https://www.openstreetmap.org/copyright">'
+                'OpenStreetMap</a> contributors')
+
+_PALETTE: Tuple[str, ...] = (
+    "#000000", "#FFFF00", "#1CE6FF", "#FF34FF", "#FF4A46", "#008941", "#006FA6", "#A30059",
+    "#FFDBE5", "#7A4900", "#0000A6", "#63FFAC", "#B79762", "#004D43", "#8FB0FF", "#997D87",
+    "#5A0007", "#809693", "#FEFFE6", "#1B4400", "#4FC601", "#3B5DFF", "#4A3B53", "#FF2F80",
+    "#61615A", "#BA0900", "#6B7900", "#00C2A0", "#FFAA92", "#FF90C9", "#B903AA", "#D16100",
+    "#DDEFFF", "#000035", "#7B4F4B", "#A1C299", "#300018", "#0AA6D8", "#013349", "#00846F",
+    "#372101", "#FFB500", "#C2FFED", "#A079BF", "#CC0744", "#C0B9B2", "#C2FF99", "#001E09",
+    "#00489C", "#6F0062", "#0CBD66", "#EEC3FF", "#456D75", "#B77B68", "#7A87A1", "#788D66",
+    "#885578", "#FAD09F", "#FF8A9A", "#D157A0", "#BEC459", "#456648", "#0086ED", "#886F4C",
+
+    "#34362D", "#B4A8BD", "#00A6AA", "#452C2C", "#636375", "#A3C8C9", "#FF913F", "#938A81",
+    "#575329", "#00FECF", "#B05B6F", "#8CD0FF", "#3B9700", "#04F757", "#C8A1A1", "#1E6E00",
+    "#7900D7", "#A77500", "#6367A9", "#A05837", "#6B002C", "#772600", "#D790FF", "#9B9700",
+    "#549E79", "#FFF69F", "#201625", "#72418F", "#BC23FF", "#99ADC0", "#3A2465", "#922329",
+    "#5B4534", "#FDE8DC", "#404E55", "#0089A3", "#CB7E98", "#A4E804", "#324E72", "#6A3A4C",
+    "#83AB58", "#001C1E", "#D1F7CE", "#004B28", "#C8D0F6", "#A3A489", "#806C66", "#222800",
+    "#BF5650", "#E83000", "#66796D", "#DA007C", "#FF1A59", "#8ADBB4", "#1E0200", "#5B4E51",
+    "#C895C5", "#320033", "#FF6832", "#66E1D3", "#CFCDAC", "#D0AC94", "#7ED379", "#012C58")
 
 def _degree_to_zoom_level(l1, l2, margin = 0.0):
 
     degree = abs(l1 - l2) * (1 + margin)
     zoom_level_int = 0
     if degree != 0:
-        zoom_level_float = math.log(360/degree)/math.log(2)
-        zoom_level_int = int(zoom_level_float)
+        zoom_level_int = int(math.log2(360/degree))
     else:
         zoom_level_int = 18
     return zoom_level_int
 
+def _grid_line_positions(bounds, res, axis_name, zoom_level=None):
+    """
+    Returns the positions of grid lines spaced ``abs(res)`` apart starting at ``bounds[0]``.
+    The line count is computed up front rather than by accumulating a float step.
+    If ``zoom_level`` is given and the lines would be less than ``MIN_GRID_SPACING_PX``
+    apart on screen, no lines are returned. Grids with more than ``MAX_GRID_LINES``
+    lines are thinned to every k-th line, since they would stall the browser.
+    """
+    step = abs(res)
+    if not step > 0:
+        raise ValueError("Grid resolution must be nonzero.")
+    if zoom_level is not None:
+        # Web Mercator tiles are 256 px wide and span 360 degrees at zoom level 0.
+        spacing_px = step * 256 * 2 ** zoom_level / 360
+        if spacing_px < MIN_GRID_SPACING_PX:
+            warnings.warn(f"Not drawing {axis_name} grid lines because they would be "
+                          f"{spacing_px:.2g} px apart at zoom level {zoom_level}, which is "
+                          f"below MIN_GRID_SPACING_PX ({MIN_GRID_SPACING_PX}).")
+            return np.empty(0)
+    n = max(int(math.floor((bounds[1] - bounds[0]) / step + 1e-9)) + 1, 0)
+    if n > MAX_GRID_LINES:
+        stride = -(-n // MAX_GRID_LINES)
+        warnings.warn(f"The resolution grid has {n} {axis_name} lines; only one line in "
+                      f"every {stride} is drawn. Raise MAX_GRID_LINES to draw them all.")
+        step *= stride
+        n = -(-n // stride)
+    return np.linspace(bounds[0], bounds[0] + (n - 1) * step, n)
+
+def _build_basemap_feature_group() -> folium.FeatureGroup:
+    """Creates the ESRI World Imagery + Stamen labels/lines basemap shared by the map functions."""
+    feat_group = folium.FeatureGroup(name='ESRI World Imagery',
+                                     overlay=False)
+    feat_group.add_child(folium.TileLayer(tiles=_ESRI_URL,
+                                          attr=_ESRI_ATTR,
+                                          name='ESRI World Imagery'))
+    feat_group.add_child(folium.TileLayer(tiles=_STAMEN_LABELS_URL,
+                                          attr=_STAMEN_ATTR,
+                                          subdomains='abcd',
+                                          min_zoom=0,
+                                          max_zoom=20))
+    feat_group.add_child(folium.TileLayer(tiles=_STAMEN_LINES_URL,
+                                          attr=_STAMEN_ATTR,
+                                          subdomains='abcd',
+                                          min_zoom=0,
+                                          max_zoom=20,
+                                          opacity=0.4))
+    return feat_group
+
 def display_map(latitude = None, longitude = None, resolution = None):
     """
     Generates a Folium map with a latlon bounded rectangle drawn on it.
@@ -31,6 +117,9 @@ def display_map(latitude = None, longitude = None, resolution = None):
         Values denote spacing of latitude and longitude lines.  
         Gridding starts at the top left corner. 
         By default, displays no grid.
+        Grid lines less than `MIN_GRID_SPACING_PX` pixels apart at the initial zoom
+        level are not drawn, and grids with more than `MAX_GRID_LINES` lines along
+        an axis are thinned.
 
     Returns
     -------
@@ -58,7 +147,16 @@ def display_map(latitude = None, longitude = None, resolution = None):
 
     ###### ###### ######   CENTER POINT        ###### ###### ######
 
-    center = [np.mean(latitude), np.mean(longitude)]
+    center = [(latitude[0] + latitude[1]) * 0.5, (longitude[0] + longitude[1]) * 0.5]
+
+    ###### ###### ######   RESOLUTION GRID    ###### ###### ######
+
+    lats = lons = np.empty(0)
+    if resolution is not None:
+        res_lat, res_lon = resolution
+
+        lats = _grid_line_positions(latitude, res_lat, 'latitude', zoom_level)
+        lons = _grid_line_positions(longitude, res_lon, 'longitude', zoom_level)
 
     ###### ###### ######   CREATE MAP         ###### ###### ######
 
@@ -67,102 +165,96 @@ def display_map(latitude = None, longitude = None, resolution = None):
         location=center,
         zoom_start=zoom_level,
     )
-    feat_group = folium.FeatureGroup(name='ESRI World Imagery',
-                                     overlay=False)
-    feat_group.add_child(folium.TileLayer(tiles='https://server.arcgisonline.com/ArcGIS/rest/'
-                                                'services/World_Imagery/MapServer/'
-                                                'tile/{z}/{y}/{x}',
-                                          attr='Tiles &copy; Esri &mdash; Source: Esri, i-cubed, '
-                                               'USDA, USGS, AEX, GeoEye, Getmapping, Aerogrid, '
-                                               'IGN, IGP, UPR-EGP, and the GIS User Community',
-                                          name='ESRI World Imagery'))
-    feat_group.add_child(folium.TileLayer(tiles='https://stamen-tiles-{s}.a.ssl.fastly.net/'
-                                                'toner-labels/{z}/{x}/{y}{r}.png',
-                                          attr='Map tiles by <a href="http://stamen.com">'
-                                               'Stamen Design</a>, <a href="http://'
-                                               'creativecommons.org/licenses/by/3.0">CC BY 3.0'
-                                               '</a> &mdash; Map data &copy; <a href="https://'
-                                               'www.openstreetmap.org/copyright">'
-                                               'OpenStreetMap</a> contributors',
-                                          subdomains='abcd',
-                                          min_zoom=0,
-                                          max_zoom=20))
-    feat_group.add_child(folium.TileLayer(tiles='https://stamen-tiles-{s}.a.ssl.fastly.net/'
-                                                'toner-lines/{z}/{x}/{y}{r}.png',
-                                          attr='Map tiles by <a href="http://stamen.com">'
-                                               'Stamen Design</a>, <a href="http://'
-                                               'creativecommons.org/licenses/by/3.0">CC BY 3.0'
-                                               '</a> &mdash; Map data &copy; <a href="https://'
-                                               'www.openstreetmap.org/copyright">'
-                                               'OpenStreetMap</a> contributors',
-                                          subdomains='abcd',
-                                          min_zoom=0,
-                                          max_zoom=20,
-                                          opacity=0.4))
-    map_hybrid.add_child(feat_group)
+    map_hybrid.add_child(_build_basemap_feature_group())
+    map_hybrid.add_child(_build_grid_and_bbox_layer(latitude, longitude, lats, lons))
+    map_hybrid.add_child(folium.features.LatLngPopup())
 
-    ###### ###### ######   RESOLUTION GRID    ###### ###### ######
+    return map_hybrid
 
-    if resolution is not None:
-        res_lat, res_lon = resolution
 
-        lats = np.arange(*latitude, abs(res_lat))
-        lons = np.arange(*longitude, abs(res_lon))
+def _build_grid_and_bbox_layer(latitude, longitude, lats, lons):
+    """Creates one GeoJson layer holding the grid lines at `lats`/`lons` and the bounding box."""
 
-        vertical_grid   = map(lambda x :([x[0][0],x[1]],[x[0][1],x[1]]),itertools.product([latitude],lons))
-        horizontal_grid = map(lambda x :([x[1],x[0][0]],[x[1],x[0][1]]),itertools.product([longitude],lats))
+    features = []
 
-        for segment in vertical_grid:
-            folium.features.PolyLine(segment, color = 'white', opacity = 0.3).add_to(map_hybrid)
+    ###### ###### ######   RESOLUTION GRID    ###### ###### ######
 
-        for segment in horizontal_grid:
-            folium.features.PolyLine(segment, color = 'white', opacity = 0.3).add_to(map_hybrid)
+    # Segment endpoints as (n_lines, 2 endpoints, (lat, lon)) arrays.
+    v_coords = np.stack([np.broadcast_to(np.asarray(latitude, dtype=np.float64), (lons.size, 2)),
+                         np.repeat(lons[:,None], 2, axis=1)], axis=-1)
+    h_coords = np.stack([np.repeat(lats[:,None], 2, axis=1),
+                         np.broadcast_to(np.asarray(longitude, dtype=np.float64), (lats.size, 2))], axis=-1)
 
-    ###### ###### ######     BOUNDING BOX     ###### ###### ######
+    # GeoJSON coordinates are (lon, lat), so flip the last axis.
+    all_segs_lonlat = np.concatenate([v_coords, h_coords])[..., ::-1]
+    if all_segs_lonlat.size > 0:
+        features.append({"type": "Feature",
+                         "geometry": {"type": "MultiLineString",
+                                      "coordinates": all_segs_lonlat.tolist()},
+                         "properties": {"color": "white", "opacity": 0.3}})
 
-    line_segments = [(latitude[0],longitude[0]),
-                     (latitude[0],longitude[1]),
-                     (latitude[1],longitude[1]),
-                     (latitude[1],longitude[0]),
-                     (latitude[0],longitude[0])
-                    ]
+    ###### ###### ######     BOUNDING BOX     ###### ###### ######
 
+    bbox = np.array([[latitude[0],longitude[0]],
+                     [latitude[0],longitude[1]],
+                     [latitude[1],longitude[1]],
+                     [latitude[1],longitude[0]],
+                     [latitude[0],longitude[0]]], dtype=np.float64)
 
+    features.append({"type": "Feature",
+                     "geometry": {"type": "LineString",
+                                  "coordinates": bbox[:, ::-1].tolist()},
+                     "properties": {"color": "red", "opacity": 0.8}})
 
-    map_hybrid.add_child(
-        folium.features.PolyLine(
-            locations=line_segments,
-            color='red',
-            opacity=0.8)
-    )
+    # Grid and bounding box are serialized together as one Leaflet layer.
+    return folium.GeoJson({"type": "FeatureCollection", "features": features},
+                          style_function=lambda f: {'color': f['properties']['color'],
+                                                    'opacity': f['properties']['opacity']})
 
-    map_hybrid.add_child(folium.features.LatLngPopup())
 
-    return map_hybrid
+class _CircleMarkerGeoJson(folium.map.Layer):
+    """
+    A GeoJSON layer that draws each Point feature as a circle marker colored by its
+    ``color`` property, with its ``label`` property as a popup. The markers share one
+    canvas renderer regardless of the map's ``prefer_canvas`` setting. Unlike
+    ``folium.GeoJson(marker=...)``, this does not require folium >= 0.15.
+    """
+    _template = Template(u"""
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }}_renderer = L.canvas({padding: 0.5});
+        var {{ this.get_name() }} = L.geoJson({{ this.data|tojson }}, {
+            pointToLayer: function (feature, latlng) {
+                return L.circleMarker(latlng, {
+                    renderer: {{ this.get_name() }}_renderer,
+                    radius: 5,
+                    color: feature.properties.color,
+                    fill: true,
+                    fillColor: feature.properties.color
+                });
+            },
+            onEachFeature: function (feature, layer) {
+                layer.bindPopup(String(feature.properties.label));
+            }
+        }).addTo({{ this._parent.get_name() }});
+        {% endmacro %}
+        """)
+
+    def __init__(self, data, name=None, overlay=True, control=True, show=True):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'CircleMarkerGeoJson'
+        self.data = data
+
+    def get_bounds(self):
+        return get_bounds(self.data, lonlat=True)
 
 
 def generate_n_visually_distinct_colors(n: int) -> List[str]:
-    colors = ["#000000", "#FFFF00", "#1CE6FF", "#FF34FF", "#FF4A46", "#008941", "#006FA6", "#A30059",
-              "#FFDBE5", "#7A4900", "#0000A6", "#63FFAC", "#B79762", "#004D43", "#8FB0FF", "#997D87",
-              "#5A0007", "#809693", "#FEFFE6", "#1B4400", "#4FC601", "#3B5DFF", "#4A3B53", "#FF2F80",
-              "#61615A", "#BA0900", "#6B7900", "#00C2A0", "#FFAA92", "#FF90C9", "#B903AA", "#D16100",
-              "#DDEFFF", "#000035", "#7B4F4B", "#A1C299", "#300018", "#0AA6D8", "#013349", "#00846F",
-              "#372101", "#FFB500", "#C2FFED", "#A079BF", "#CC0744", "#C0B9B2", "#C2FF99", "#001E09",
-              "#00489C", "#6F0062", "#0CBD66", "#EEC3FF", "#456D75", "#B77B68", "#7A87A1", "#788D66",
-              "#885578", "#FAD09F", "#FF8A9A", "#D157A0", "#BEC459", "#456648", "#0086ED", "#886F4C",
-
-              "#34362D", "#B4A8BD", "#00A6AA", "#452C2C", "#636375", "#A3C8C9", "#FF913F", "#938A81",
-              "#575329", "#00FECF", "#B05B6F", "#8CD0FF", "#3B9700", "#04F757", "#C8A1A1", "#1E6E00",
-              "#7900D7", "#A77500", "#6367A9", "#A05837", "#6B002C", "#772600", "#D790FF", "#9B9700",
-              "#549E79", "#FFF69F", "#201625", "#72418F", "#BC23FF", "#99ADC0", "#3A2465", "#922329",
-              "#5B4534", "#FDE8DC", "#404E55", "#0089A3", "#CB7E98", "#A4E804", "#324E72", "#6A3A4C",
-              "#83AB58", "#001C1E", "#D1F7CE", "#004B28", "#C8D0F6", "#A3A489", "#806C66", "#222800",
-              "#BF5650", "#E83000", "#66796D", "#DA007C", "#FF1A59", "#8ADBB4", "#1E0200", "#5B4E51",
-              "#C895C5", "#320033", "#FF6832", "#66E1D3", "#CFCDAC", "#D0AC94", "#7ED379", "#012C58"]
-
-    if n > len(colors):
-        raise Exception("Can not generate more than {} distinct colors.".format(str(len(colors))))
-    return colors[:n]
+    if n <= len(_PALETTE):
+        return list(_PALETTE[:n])
+    # Beyond the palette, fall back to evenly spaced hues.
+    hues = np.linspace(0, 1, n, endpoint=False)
+    return ["#{:02X}{:02X}{:02X}".format(*(int(round(c * 255)) for c in colorsys.hls_to_rgb(h, 0.5, 0.7)))
+            for h in hues.tolist()]
 
 
 def display_grouped_pandas_rows_as_pins(data_frame: pd.DataFrame,
@@ -171,16 +263,16 @@ def display_grouped_pandas_rows_as_pins(data_frame: pd.DataFrame,
     '''Groups pandas rows by values in a selected column and renders them as annotated circles on a folium.Map'''
     group_column_name = group_name
 
-    center = (data_frame.Latitude.mean(),
-              data_frame.Longitude.mean())
+    lats = data_frame.Latitude.to_numpy(dtype=np.float64)
+    lons = data_frame.Longitude.to_numpy(dtype=np.float64)
 
-    zoom_level = _degree_to_zoom_level(data_frame.Latitude.min(),
-                                       data_frame.Latitude.max())
+    center = (lats.mean(), lons.mean())
 
-    labels = list(pd.unique(data_frame[group_column_name]))
-    pallete = generate_n_visually_distinct_colors(n=len(labels))
+    zoom_level = _degree_to_zoom_level(lats.min(), lats.max())
 
-    colors = {_label: _color for _label, _color in zip(labels, pallete)}
+    unique_labels = pd.unique(data_frame[group_column_name])
+    colors = dict(zip(unique_labels,
+                      generate_n_visually_distinct_colors(n=len(unique_labels))))
 
     m = folium_map
     if m == None:
@@ -189,50 +281,20 @@ def display_grouped_pandas_rows_as_pins(data_frame: pd.DataFrame,
             location=center,
             zoom_start=zoom_level
             )
-        f = folium.FeatureGroup(name='ESRI World Imagery',
-                                overlay=False)
-        f.add_child(folium.TileLayer(tiles='https://server.arcgisonline.com/ArcGIS/rest/services/'
-                                           'World_Imagery/MapServer/tile/{z}/{y}/{x}',
-                                     attr='Tiles &copy; Esri &mdash; Source: Esri, i-cubed, '
-                                          'USDA, USGS, AEX, GeoEye, Getmapping, Aerogrid, IGN, '
-                                          'IGP, UPR-EGP, and the GIS User Community',
-                                     name='ESRI World Imagery'))
-        f.add_child(folium.TileLayer(tiles='https://stamen-tiles-{s}.a.ssl.fastly.net/toner-labels/'
-                                           '{z}/{x}/{y}{r}.png',
-                                     attr='Map tiles by <a href="http://stamen.com">'
-                                          'Stamen Design</a>, <a href="http://creativecommons.org/'
-                                          'licenses/by/3.0">CC BY 3.0</a> &mdash; Map data &copy; '
-                                          '<a href="https://www.openstreetmap.org/copyright">'
-                                          'OpenStreetMap</a> contributors',
-                                     subdomains='abcd',
-                                     min_zoom=0,
-                                     max_zoom=20))
-        f.add_child(folium.TileLayer(tiles='https://stamen-tiles-{s}.a.ssl.fastly.net/toner-lines/'
-                                           '{z}/{x}/{y}{r}.png',
-                                     attr='Map tiles by <a href="http://stamen.com">'
-                                          'Stamen Design</a>, <a href="http://creativecommons.org/'
-                                          'licenses/by/3.0">CC BY 3.0</a> &mdash; Map data &copy; '
-                                          '<a href="https://www.openstreetmap.org/copyright">'
-                                          'OpenStreetMap</a> contributors',
-                                     subdomains='abcd',
-                                     min_zoom=0,
-                                     max_zoom=20,
-                                     opacity=0.4))
-        m.add_child(f)
-
-    for i in range(0, len(data_frame)):
-        land_cover = data_frame.iloc[i][group_column_name]
-        index = labels.index(land_cover)
-        _color = colors[land_cover]
-
-        folium.vector_layers.CircleMarker(
-            location=[data_frame.iloc[i]['Latitude'], data_frame.iloc[i]['Longitude']],
-            radius=5,
-            popup=land_cover,
-            color=_color,
-            fill=True,
-            fill_color=_color
-        ).add_to(m)
+        m.add_child(_build_basemap_feature_group())
+
+    groups = data_frame[group_column_name]
+    color_col = groups.map(colors).to_numpy()
+    label_col = groups.astype(str).to_numpy()
+
+    # All pins are serialized as one GeoJSON layer and styled per feature.
+    features = [{"type": "Feature",
+                 "geometry": {"type": "Point", "coordinates": [lon, lat]},
+                 "properties": {"color": color, "label": label}}
+                for lat, lon, color, label in zip(lats.tolist(), lons.tolist(),
+                                                  color_col.tolist(), label_col.tolist())]
+    _CircleMarkerGeoJson({"type": "FeatureCollection", "features": features},
+                         name=group_column_name).add_to(m)
 
     m.add_child(folium.features.LatLngPopup())
     return m
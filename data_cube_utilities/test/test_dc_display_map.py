@@ -0,0 +1,117 @@
+import re
+import unittest
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from data_cube_utilities import dc_display_map
+
+
+class TestDCDisplayMap(unittest.TestCase):
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+    def test_grid_line_positions_exact_multiple(self):
+        positions = dc_display_map._grid_line_positions((0, 0.3), 0.1, 'latitude')
+        self.assertEqual(positions.size, 4)
+        self.assertTrue(np.allclose(positions, [0, 0.1, 0.2, 0.3]))
+
+    def test_grid_line_positions_non_multiple(self):
+        positions = dc_display_map._grid_line_positions((0, 0.35), 0.1, 'latitude')
+        self.assertEqual(positions.size, 4)
+        self.assertTrue(np.allclose(positions, [0, 0.1, 0.2, 0.3]))
+
+        positions = dc_display_map._grid_line_positions((-1, 1.25), -0.5, 'longitude')
+        self.assertTrue(np.allclose(positions, [-1, -0.5, 0, 0.5, 1]))
+
+    def test_grid_line_positions_reversed_bounds(self):
+        positions = dc_display_map._grid_line_positions((1, 0), 0.1, 'latitude')
+        self.assertEqual(positions.size, 0)
+
+    def test_grid_line_positions_zero_resolution(self):
+        with self.assertRaises(ValueError):
+            dc_display_map._grid_line_positions((0, 1), 0, 'latitude')
+
+    def test_grid_line_positions_thinning(self):
+        bounds = (0, 1)
+        with self.assertWarns(UserWarning):
+            positions = dc_display_map._grid_line_positions(bounds, 1e-4, 'latitude')
+        self.assertLessEqual(positions.size, dc_display_map.MAX_GRID_LINES)
+        self.assertEqual(positions[0], bounds[0])
+        self.assertLessEqual(positions[-1], bounds[1])
+        # The kept lines are still evenly spaced, at a multiple of the resolution.
+        spacing = np.diff(positions)
+        self.assertTrue(np.allclose(spacing, spacing[0]))
+        self.assertAlmostEqual(spacing[0] / 1e-4, round(spacing[0] / 1e-4))
+
+    def test_grid_line_positions_screen_spacing(self):
+        # 10 degree lines over the globe are well apart on screen, even at zoom level 1.
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            positions = dc_display_map._grid_line_positions((-180, 180), 10, 'longitude', zoom_level=1)
+        self.assertEqual(positions.size, 37)
+
+        with self.assertWarns(UserWarning):
+            positions = dc_display_map._grid_line_positions((0, 1), 1e-7, 'latitude', zoom_level=9)
+        self.assertEqual(positions.size, 0)
+
+    def test_generate_n_visually_distinct_colors(self):
+        palette = dc_display_map.generate_n_visually_distinct_colors(128)
+        self.assertEqual(len(palette), 128)
+        self.assertEqual(dc_display_map.generate_n_visually_distinct_colors(10), palette[:10])
+        self.assertEqual(dc_display_map.generate_n_visually_distinct_colors(0), [])
+
+        colors = dc_display_map.generate_n_visually_distinct_colors(300)
+        self.assertEqual(len(colors), 300)
+        self.assertEqual(len(set(colors)), 300)
+        self.assertTrue(all(re.fullmatch('#[0-9A-F]{6}', color) for color in colors))
+
+    def test_display_grouped_pandas_rows_as_pins(self):
+        data_frame = pd.DataFrame({'Latitude': [0.0, 1.0, 2.0],
+                                   'Longitude': [3.0, 4.0, 5.0],
+                                   'LandUse': ['Forest', 'Water', 'Forest']})
+        m = dc_display_map.display_grouped_pandas_rows_as_pins(data_frame)
+        html = m.get_root().render()
+
+        self.assertIn('L.circleMarker', html)
+        forest_color, water_color = dc_display_map.generate_n_visually_distinct_colors(2)
+        self.assertEqual(html.count('"color": "{}"'.format(forest_color)), 2)
+        self.assertEqual(html.count('"color": "{}"'.format(water_color)), 1)
+        self.assertEqual(m.get_bounds(), [[0.0, 3.0], [2.0, 5.0]])
+
+    def test_display_grouped_pandas_rows_as_pins_on_display_map(self):
+        data_frame = pd.DataFrame({'Latitude': [0.0, 1.0], 'Longitude': [3.0, 4.0],
+                                   'LandUse': ['Forest', 'Water']})
+        m = dc_display_map.display_map((0, 1), (3, 4))
+        self.assertIs(dc_display_map.display_grouped_pandas_rows_as_pins(data_frame, folium_map=m), m)
+        # Pins are painted on a canvas even though display_map does not set prefer_canvas.
+        self.assertIn('L.canvas', m.get_root().render())
+
+    def test_build_grid_and_bbox_layer(self):
+        layer = dc_display_map._build_grid_and_bbox_layer((0, 1), (2, 3),
+                                                          np.array([0.0, 0.5, 1.0]), np.array([2.0, 3.0]))
+        grid, bbox = layer.data['features']
+
+        # GeoJSON coordinates are in (lon, lat) order.
+        self.assertEqual(grid['geometry']['type'], 'MultiLineString')
+        self.assertEqual(grid['geometry']['coordinates'],
+                         [[[2.0, 0.0], [2.0, 1.0]],
+                          [[3.0, 0.0], [3.0, 1.0]],
+                          [[2.0, 0.0], [3.0, 0.0]],
+                          [[2.0, 0.5], [3.0, 0.5]],
+                          [[2.0, 1.0], [3.0, 1.0]]])
+        self.assertEqual(bbox['geometry']['type'], 'LineString')
+        self.assertEqual(bbox['geometry']['coordinates'],
+                         [[2.0, 0.0], [3.0, 0.0], [3.0, 1.0], [2.0, 1.0], [2.0, 0.0]])
+
+        self.assertEqual(layer.style_function(grid), {'color': 'white', 'opacity': 0.3})
+        self.assertEqual(layer.style_function(bbox), {'color': 'red', 'opacity': 0.8})
+
+        # Without grid lines only the bounding box is drawn.
+        layer = dc_display_map._build_grid_and_bbox_layer((0, 1), (2, 3), np.empty(0), np.empty(0))
+        self.assertEqual([f['geometry']['type'] for f in layer.data['features']], ['LineString'])
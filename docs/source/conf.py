@@ -64,14 +64,19 @@ autosummary_generate = True
 # a list of builtin themes.
 #
 # html_theme = 'classic'
-import sphinx_rtd_theme
-
-html_theme = 'sphinx_rtd_theme'
-html_theme_path = [sphinx_rtd_theme.get_html_theme_path()]
-html_theme_options = {
-    'collapse_navigation': False,
-    'logo_only': True,
-}
+# Fall back to Sphinx's default theme when sphinx_rtd_theme is not installed
+# (e.g. for linkcheck or doctest builds that do not need it).
+try:
+    import sphinx_rtd_theme
+except ImportError:
+    html_theme = 'alabaster'
+else:
+    html_theme = 'sphinx_rtd_theme'
+    html_theme_path = [sphinx_rtd_theme.get_html_theme_path()]
+    html_theme_options = {
+        'collapse_navigation': False,
+        'logo_only': True,
+    }
 html_logo = '_static/ceos_logo.svg'
 
 # Add any paths that contain custom static files (such as style sheets) here,